@@ -1,11 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
-import csv
-import io
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify
+from werkzeug.security import check_password_hash
+import hmac
 import os
 from datetime import datetime
 
+from db import ADMIN_ROWS_PLACEHOLDER, admin_rows_html, gzip_stream, init_db, iter_export_csv, record_punch
+
 """
 Attendance Tracking Web Application
 ----------------------------------
@@ -17,11 +17,12 @@ administrator can log in to download attendance records as a CSV file. This
 application uses a local SQLite database (attendance.db) to store records.
 
 Usage:
-    python app.py
+    gunicorn app:app          # production, settings in gunicorn.conf.py
+    python app.py             # local development server only
 
-The application will be served locally on http://localhost:5000. In production
-environments, consider using a proper WSGI server (gunicorn) and host on a
-platform that supports Python web apps.
+The application will be served on http://localhost:5000. Gunicorn picks up
+gunicorn.conf.py automatically and runs several threaded workers so punches
+and admin requests are served concurrently.
 """
 
 app = Flask(__name__)
@@ -29,37 +30,22 @@ app.secret_key = os.environ.get('APP_SECRET_KEY', 'replace-with-a-secure-random-
 
 # Admin credentials (username: admin, password hashed)
 # In a real deployment, store these in environment variables or a secure secrets
+# store. ADMIN_PASSWORD_HASH is a pre-computed werkzeug generate_password_hash()
+# value, so workers do not run PBKDF2 at import time. Without it, ADMIN_PASSWORD
+# is compared directly in constant time.
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
-ADMIN_PASSWORD_HASH = generate_password_hash(os.environ.get('ADMIN_PASSWORD', 'admin123'))
-
-# Database initialization
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance.db')
-
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def init_db():
-    """Initialize the SQLite database with the required table."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT NOT NULL,
-            action TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            latitude REAL,
-            longitude REAL
-        );
-        """
-    )
-    conn.commit()
-    conn.close()
+ADMIN_PASSWORD_HASH = os.environ.get('ADMIN_PASSWORD_HASH')
+ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+
+
+def check_admin_credentials(username, password):
+    """Check admin credentials without leaking timing information."""
+    username_ok = hmac.compare_digest(username.encode('utf-8'), ADMIN_USERNAME.encode('utf-8'))
+    if ADMIN_PASSWORD_HASH:
+        password_ok = check_password_hash(ADMIN_PASSWORD_HASH, password)
+    else:
+        password_ok = hmac.compare_digest(password.encode('utf-8'), ADMIN_PASSWORD.encode('utf-8'))
+    return username_ok & password_ok
 
 
 # Ensure database is initialized when app starts
@@ -83,7 +69,9 @@ def punch():
     current timestamp in ISO 8601 format (UTC) along with the provided data.
     Returns a JSON response indicating success or failure.
     """
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Invalid JSON.'}), 400
     employee_id = data.get('employee_id')
     action = data.get('action')
     latitude = data.get('latitude')
@@ -95,15 +83,12 @@ def punch():
     if action not in ['in', 'out']:
         return jsonify({'success': False, 'message': 'Invalid action specified.'}), 400
 
-    timestamp = datetime.utcnow().isoformat()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO attendance (employee_id, action, timestamp, latitude, longitude) VALUES (?, ?, ?, ?, ?)',
-        (employee_id, action, timestamp, latitude, longitude)
-    )
-    conn.commit()
-    conn.close()
+    try:
+        record_punch(employee_id, action, latitude, longitude)
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+    except TimeoutError:
+        return jsonify({'success': False, 'message': 'Server is busy, please try again.'}), 503
 
     return jsonify({'success': True, 'message': 'Punch recorded successfully.'})
 
@@ -115,9 +100,9 @@ def admin_login():
     successful login, redirect to the admin dashboard.
     """
     if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        if username == ADMIN_USERNAME and check_password_hash(ADMIN_PASSWORD_HASH, password):
+        username = request.form.get('username', '')
+        password = request.form.get('password', '')
+        if check_admin_credentials(username, password):
             session['admin_logged_in'] = True
             return redirect(url_for('admin_dashboard'))
         else:
@@ -129,19 +114,17 @@ def admin_login():
 @app.route('/admin')
 def admin_dashboard():
     """
-    Admin dashboard page. Requires admin to be logged in. Shows summary of
-    attendance records and provides a link to export data.
+    Admin dashboard page. Requires admin to be logged in. Shows the most recent
+    attendance records, ADMIN_PAGE_SIZE per page (``?page=N``), and provides a
+    link to export data.
     """
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM attendance ORDER BY timestamp DESC')
-    records = cur.fetchall()
-    conn.close()
-
-    return render_template('admin.html', records=records)
+    page = max(request.args.get('page', 1, type=int), 1)
+    # admin.html is shared with server.py, which fills the rows placeholder
+    # itself, so the rows are rendered outside Jinja here too
+    return render_template('admin.html').replace(ADMIN_ROWS_PLACEHOLDER, admin_rows_html(page))
 
 
 @app.route('/admin/logout')
@@ -155,31 +138,19 @@ def admin_logout():
 def export_csv():
     """
     Endpoint for admin to export attendance records as CSV. Requires admin
-    authentication. Returns a CSV file as an attachment.
+    authentication. Streams a CSV file as an attachment, gzip-compressed when
+    the client accepts it.
     """
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT employee_id, action, timestamp, latitude, longitude FROM attendance ORDER BY timestamp')
-    data_rows = cur.fetchall()
-    conn.close()
-
-    # Create CSV in memory
-    output = io.StringIO()
-    csv_writer = csv.writer(output)
-    csv_writer.writerow(['Employee ID', 'Action', 'Timestamp (UTC)', 'Latitude', 'Longitude'])
-    for row in data_rows:
-        csv_writer.writerow(row)
-    output.seek(0)
-
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'attendance_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.csv'
-    )
+    filename = f'attendance_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.csv'
+    headers = {'Content-Disposition': f'attachment; filename={filename}', 'Vary': 'Accept-Encoding'}
+    chunks = iter_export_csv()
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype='text/csv', headers=headers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,371 @@
+"""
+Attendance Database Access
+--------------------------
+
+SQLite storage shared by the Flask application (app.py) and the standalone
+server (server.py). It owns the connection pool, the background writer thread
+that batches punch inserts, periodic maintenance, the streamed CSV export and
+the admin dashboard's table rows.
+Only the Python standard library is used, so server.py keeps working without
+any external packages.
+"""
+
+import atexit
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import closing, contextmanager
+from datetime import datetime
+from html import escape
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock around schema setup
+    fcntl = None
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance.db')
+
+# Number of long-lived connections kept open and shared between requests
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+_pool = queue.Queue(maxsize=POOL_SIZE)
+
+# Rows fetched from SQLite per chunk when streaming the CSV export
+EXPORT_BATCH_SIZE = 500
+# SQLite formats each export row as a finished CSV line, so only one string per
+# row crosses into Python. employee_id, latitude and longitude come from the
+# client and SQLite does not enforce column types, so they are quoted RFC 4180
+# style when they contain a quote, comma or line break; action and timestamp
+# are checked or generated by the server and never need quoting.
+EXPORT_CSV_HEADER = b'Employee ID,Action,Timestamp (UTC),Latitude,Longitude\r\n'
+_CSV_FIELD_SQL = """
+    CASE WHEN instr({0}, '"') OR instr({0}, ',')
+              OR instr({0}, char(10)) OR instr({0}, char(13))
+         THEN '"' || replace({0}, '"', '""') || '"'
+         ELSE {0} END"""
+EXPORT_CSV_SQL = """
+SELECT printf('%s,%s,%s,%s,%s',{},
+    action, timestamp,{},{}) || char(13, 10)
+FROM attendance ORDER BY timestamp
+""".format(*map(_CSV_FIELD_SQL.format, ('employee_id', 'latitude', 'longitude')))
+
+# Records shown per page on the admin dashboard; the rendered rows replace
+# ADMIN_ROWS_PLACEHOLDER in templates/admin.html
+ADMIN_PAGE_SIZE = 100
+# Highest page number honoured; larger ?page= values would overflow the
+# 64-bit OFFSET SQLite accepts
+ADMIN_MAX_PAGE = (2 ** 63 - 1) // ADMIN_PAGE_SIZE
+ADMIN_ROWS_PLACEHOLDER = '<!-- Records will be injected by the server -->'
+_ADMIN_ROW = '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format
+
+# Punches are handed to a single background writer thread which commits them
+# in batches of up to WRITE_BATCH_SIZE rows, waiting at most WRITE_BATCH_WINDOW
+# seconds for more punches to arrive.
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_WINDOW = 0.05
+# Seconds a request waits for its punch to be committed before giving up
+PUNCH_TIMEOUT = 10
+# Kept as a single constant so every insert reuses the same prepared statement
+INSERT_PUNCH_SQL = (
+    'INSERT INTO attendance (employee_id, action, timestamp, latitude, longitude) VALUES (?, ?, ?, ?, ?)'
+)
+_write_q = queue.Queue()
+# Errors caused by one row's data; a batch failing with one of these is retried
+# row by row. Anything else (e.g. "database is locked") fails the whole batch.
+_ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.DataError,
+               OverflowError, TypeError, ValueError)
+# Bound once so the punch path skips the attribute lookup on every request.
+# datetime.utcnow().isoformat() is already faster than formatting time.time()
+# by hand, so timestamps stay ISO 8601 text.
+_utcnow = datetime.utcnow
+_writer_thread = None
+
+# WAL/cache tuning: checkpoint every WAL_AUTOCHECKPOINT pages rather than
+# SQLite's default 1000, and give each connection a 64 MiB page cache
+WAL_AUTOCHECKPOINT = 10000
+CACHE_SIZE_KIB = 64 * 1024
+# Seconds between background WAL truncation and planner statistics refresh
+MAINTENANCE_INTERVAL = 24 * 60 * 60
+
+# Schema setup, run as one script. The index lets the ORDER BY timestamp
+# queries walk the index instead of sorting.
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    latitude REAL,
+    longitude REAL
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance(timestamp);
+"""
+
+
+def get_db_connection():
+    """
+    Open a connection to the attendance database in WAL mode with
+    synchronous=NORMAL, so readers (admin dashboard/export) are not blocked by
+    punches and each commit does not wait on a full fsync.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    if not DB_PATH.endswith(':memory:'):
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=30000000000')
+        conn.execute(f'PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+    return conn
+
+
+@contextmanager
+def borrow():
+    """
+    Borrow a pooled connection for the duration of a ``with`` block. Reusing
+    connections avoids the connect/teardown cost on every request and keeps
+    SQLite's page cache warm. Any transaction left open is rolled back before
+    the connection is returned to the pool.
+    """
+    conn = _pool.get()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put(conn)
+
+
+@contextmanager
+def _init_lock():
+    """Hold an exclusive lock on DB_PATH + '.lock' where fcntl is available."""
+    if fcntl is None:
+        yield
+        return
+    with open(DB_PATH + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def init_db():
+    """
+    Create the attendance table if it does not exist, open the connection pool
+    and start the background writer and maintenance threads.
+    """
+    # Gunicorn workers import the app at the same time; the lock stops them
+    # racing to create the schema and switch the journal mode
+    with _init_lock(), closing(sqlite3.connect(DB_PATH)) as conn:
+        conn.executescript(SCHEMA)
+
+    # Pre-open the pooled connections now that the schema exists
+    while not _pool.full():
+        _pool.put(get_db_connection())
+    # Start the background writer and maintenance threads once per process
+    global _writer_thread
+    if _writer_thread is None:
+        _writer_thread = threading.Thread(target=_writer_loop, name='punch-writer', daemon=True)
+        _writer_thread.start()
+        threading.Thread(target=_maintenance_loop, name='db-maintenance', daemon=True).start()
+        atexit.register(_close_pool)
+
+
+def _write_batch(conn, cur, batch):
+    """
+    Insert a batch of queued punches in a single transaction and resolve each
+    submitter's future. If a row's data makes the batch fail, the rows are
+    retried one by one so a single bad row does not fail the punches queued
+    alongside it; other errors propagate and fail the whole batch at once.
+    """
+    try:
+        with conn:
+            cur.executemany(INSERT_PUNCH_SQL, [row for row, _ in batch])
+    except _ROW_ERRORS:
+        for row, future in batch:
+            try:
+                with conn:
+                    cur.execute(INSERT_PUNCH_SQL, row)
+            except _ROW_ERRORS as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(None)
+    else:
+        for _, future in batch:
+            future.set_result(None)
+
+
+def _writer_loop():
+    """
+    Background writer: collect punches for up to WRITE_BATCH_WINDOW seconds
+    (or WRITE_BATCH_SIZE rows) and commit them together, so one fsync covers
+    every punch that arrived in that window.
+    """
+    conn = get_db_connection()
+    # One cursor for the life of the thread; INSERT_PUNCH_SQL never changes, so
+    # SQLite's statement cache compiles it only once.
+    cur = conn.cursor()
+    while True:
+        batch = [_write_q.get()]
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_write_q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Skip punches whose submitter already gave up waiting; a cancelled
+        # future means the request was answered "not recorded"
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            continue
+        try:
+            _write_batch(conn, cur, batch)
+        except Exception as exc:
+            # Never let a failure end the thread; fail whatever is unresolved
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+
+
+def _coordinate(value):
+    """Return ``value`` as a finite float (or None), raising ValueError otherwise."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('Latitude and longitude must be numbers.')
+    try:
+        value = float(value)
+    except OverflowError:
+        raise ValueError('Latitude and longitude must be numbers.') from None
+    if not math.isfinite(value):
+        raise ValueError('Latitude and longitude must be numbers.')
+    return value
+
+
+def record_punch(employee_id, action, latitude, longitude):
+    """
+    Stamp a punch with the current UTC time, queue it for the background
+    writer and block until it is committed. Raises ValueError for a payload
+    that cannot be stored, and TimeoutError if the writer does not pick the
+    punch up within PUNCH_TIMEOUT seconds or the database stays locked; the
+    punch is then never written.
+    """
+    # Numeric IDs were always accepted and stored as text, e.g. 123 as '123'
+    if isinstance(employee_id, int) and not isinstance(employee_id, bool):
+        employee_id = str(employee_id)
+    if not isinstance(employee_id, str) or not employee_id:
+        raise ValueError('Employee ID must be a non-empty string or an integer.')
+    latitude = _coordinate(latitude)
+    longitude = _coordinate(longitude)
+    future = Future()
+    _write_q.put(((employee_id, action, _utcnow().isoformat(), latitude, longitude), future))
+    try:
+        try:
+            future.result(timeout=PUNCH_TIMEOUT)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise TimeoutError('Punch was not committed in time.') from None
+            # The writer is already inserting it, so wait for the real outcome
+            future.result()
+    except sqlite3.OperationalError:
+        # The batch was rolled back, typically because the database was locked
+        raise TimeoutError('Database is busy.') from None
+
+
+def _maintenance_loop():
+    """
+    Periodically truncate the WAL file so it stays bounded, and run
+    PRAGMA optimize so the query planner's statistics follow the table's growth.
+    """
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        try:
+            with borrow() as conn:
+                conn.execute('PRAGMA optimize')
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except sqlite3.Error:
+            # Try again next interval, e.g. if the database was locked
+            pass
+
+
+def _close_pool():
+    """At exit, run PRAGMA optimize on each idle pooled connection and close it."""
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            conn.execute('PRAGMA optimize')
+        except sqlite3.Error:
+            pass
+        conn.close()
+
+
+def iter_export_csv():
+    """
+    Yield the CSV export as UTF-8 chunks of EXPORT_BATCH_SIZE rows. The export
+    reads from its own short-lived connection, which stays open until the
+    client has downloaded the last chunk, so slow downloads never tie up the
+    request pool.
+    """
+    yield EXPORT_CSV_HEADER
+    with closing(get_db_connection()) as conn:
+        cur = conn.cursor()
+        cur.execute(EXPORT_CSV_SQL)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield ''.join([line for (line,) in rows]).encode('utf-8')
+
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of byte chunks; level 1 is fastest and still shrinks CSV well."""
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def admin_rows_html(page):
+    """
+    Render one page of the admin dashboard (newest first) as HTML table rows,
+    followed by a row of Newer/Older links when there is more than one page.
+    ``page`` is clamped to 1..ADMIN_MAX_PAGE.
+    """
+    page = min(max(page, 1), ADMIN_MAX_PAGE)
+    # Pull the page plus one extra row to find out whether an older page exists
+    with borrow() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            'SELECT id, employee_id, action, timestamp, latitude, longitude '
+            'FROM attendance ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+            (ADMIN_PAGE_SIZE + 1, (page - 1) * ADMIN_PAGE_SIZE)
+        )
+        # Build table rows straight from the cursor, escaping every stored value
+        rows = [
+            _ADMIN_ROW(rec_id, escape(employee_id), escape(action), escape(ts),
+                       '-' if lat is None else escape(str(lat)),
+                       '-' if lon is None else escape(str(lon)))
+            for rec_id, employee_id, action, ts, lat, lon in islice(cur, ADMIN_PAGE_SIZE)
+        ]
+        has_next = cur.fetchone() is not None
+    # Pagination links as a final table row
+    if page > 1 or has_next:
+        links = []
+        if page > 1:
+            links.append(f'<a href="/admin?page={page - 1}">&laquo; Newer</a>')
+        if has_next:
+            links.append(f'<a class="float-end" href="/admin?page={page + 1}">Older &raquo;</a>')
+        rows.append(f'<tr><td colspan="6">{"".join(links)}</td></tr>')
+    return ''.join(rows)
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for the attendance application.
+
+Usage:
+    gunicorn app:app
+
+Worker count follows the usual 2 * cores + 1 rule. Each worker runs a small
+thread pool so slow SQLite reads/writes do not hold up other requests.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * multiprocessing.cpu_count() + 1))
+worker_class = 'gthread'
+threads = 4
@@ -6,56 +6,104 @@ Simple Attendance Tracking Web Server
 This script runs a basic HTTP server using Python's built-in `http.server` module.
 It serves static files, handles API requests for recording attendance punches,
 and provides a minimal admin interface with login and CSV export functionality.
-Data is stored in an SQLite database (`attendance.db`). The server does not
-depend on any external Python packages, making it suitable for environments
-without internet access.
+Data is stored in an SQLite database (`attendance.db`) through db.py. The
+server does not depend on any external Python packages, making it suitable for
+environments without internet access.
 
 Usage:
     python3 server.py
 
 The server will listen on http://localhost:8000 by default. You can set the
-PORT environment variable to change the port.
+PORT environment variable to change the port. Each request is handled on its
+own thread, so a slow database write does not block other clients.
 """
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import base64
+import gzip
+import hashlib
+import hmac
 import json
-import sqlite3
+import mimetypes
 import os
-from urllib.parse import urlparse, parse_qs
+import secrets
+import time
+from urllib.parse import urlparse, parse_qs, unquote_plus
 from datetime import datetime
-import uuid
+
+from db import ADMIN_ROWS_PLACEHOLDER, admin_rows_html, gzip_stream, init_db, iter_export_csv, record_punch
 
 # Directory configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
-DB_PATH = os.path.join(BASE_DIR, 'attendance.db')
-
-# In-memory session store: maps session_id to True if admin is authenticated
-sessions = {}
-
-
-def init_db():
-    """Create the attendance table if it does not exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT NOT NULL,
-            action TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            latitude REAL,
-            longitude REAL
-        );
-        """
-    )
-    conn.commit()
-    conn.close()
-
-
-class AttendanceHandler(SimpleHTTPRequestHandler):
+
+# Templates never change at runtime, so read them once at startup
+_TEMPLATE_CACHE = {}
+for _name in os.listdir(TEMPLATES_DIR):
+    with open(os.path.join(TEMPLATES_DIR, _name), 'rb') as _f:
+        _TEMPLATE_CACHE[_name] = _f.read()
+# Admin template split around the records placeholder
+_ADMIN_HEAD, _, _ADMIN_TAIL = _TEMPLATE_CACHE['admin.html'].partition(ADMIN_ROWS_PLACEHOLDER.encode('utf-8'))
+
+# Static assets are cached by browsers for STATIC_MAX_AGE seconds (default one
+# year); change an asset's URL when its contents change
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 31536000))
+# Text assets sent gzip-compressed to clients that accept it
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js')
+# Every file under static/ is loaded once at startup and served from memory.
+# Maps URL path to (body, ETag, gzip body or None, gzip ETag or None,
+# Content-Type); only these exact URLs are served, so no request path ever
+# reaches the filesystem. The gzip body gets its own ETag because it is a
+# different representation of the same URL.
+_STATIC = {}
+for _root, _, _files in os.walk(STATIC_DIR):
+    for _name in _files:
+        _path = os.path.join(_root, _name)
+        with open(_path, 'rb') as _f:
+            _data = _f.read()
+        _st = os.stat(_path)
+        _etag = f'{_st.st_mtime_ns:x}-{_st.st_size:x}'
+        _compressible = _name.endswith(COMPRESSIBLE_EXTENSIONS)
+        _STATIC['/static/' + os.path.relpath(_path, STATIC_DIR).replace(os.sep, '/')] = (
+            _data,
+            f'"{_etag}"',
+            gzip.compress(_data) if _compressible else None,
+            f'"{_etag}-gz"' if _compressible else None,
+            mimetypes.guess_type(_name)[0] or 'application/octet-stream',
+        )
+
+# Admin sessions are stateless: the cookie carries a timestamp signed with
+# SECRET_KEY and is valid for SESSION_MAX_AGE seconds. Without APP_SECRET_KEY a
+# random key is used, so sessions do not survive a restart.
+SECRET_KEY = os.environ.get('APP_SECRET_KEY', '').encode('utf-8') or secrets.token_bytes(32)
+SESSION_MAX_AGE = 8 * 60 * 60
+# Set SESSION_COOKIE_SECURE=1 when served over HTTPS
+SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE') == '1'
+
+
+def _session_signature(timestamp):
+    mac = hmac.new(SECRET_KEY, b'admin.' + timestamp.encode('ascii'), hashlib.sha256)
+    return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=')
+
+
+def sign_session():
+    """Return a signed admin session token for the current time."""
+    timestamp = str(int(time.time()))
+    return f'{timestamp}.{_session_signature(timestamp).decode("ascii")}'
+
+
+def verify_session(token):
+    """Return True if ``token`` carries a valid signature and has not expired."""
+    timestamp, _, signature = token.partition('.')
+    if not (timestamp.isascii() and timestamp.isdigit()):
+        return False
+    if not hmac.compare_digest(signature.encode('utf-8'), _session_signature(timestamp)):
+        return False
+    return 0 <= time.time() - int(timestamp) <= SESSION_MAX_AGE
+
+
+class AttendanceHandler(BaseHTTPRequestHandler):
     """Custom HTTP handler for the attendance application."""
 
     def do_GET(self):
@@ -82,6 +130,10 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
         # 404 for all other paths
         self.send_error(404, 'Not Found')
 
+    def do_HEAD(self):
+        # Same routing and headers as GET; write_body() drops the body
+        return self.do_GET()
+
     def do_POST(self):
         parsed = urlparse(self.path)
         path = parsed.path
@@ -93,29 +145,52 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
         self.send_error(404, 'Not Found')
 
     # Utility methods
+    def write_body(self, data):
+        """Write a response body, except for HEAD requests."""
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
     def serve_static(self, path):
-        """Serve static assets located under the static directory."""
-        # Map URL path to local filesystem path
-        local_path = os.path.normpath(path.lstrip('/'))
-        file_path = os.path.join(BASE_DIR, local_path)
-        # Security check: ensure the file is within the static directory
-        if not os.path.commonprefix([file_path, STATIC_DIR]) == STATIC_DIR:
-            self.send_error(403, 'Forbidden')
+        """Serve static assets from the in-memory cache built at startup."""
+        entry = _STATIC.get(path)
+        if entry is None:
+            self.send_error(404, 'File not found')
+            return
+        data, etag, gzip_data, gzip_etag, content_type = entry
+        gzipped = gzip_data is not None and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body, etag = gzip_data, gzip_etag
+        else:
+            body = data
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'public, max-age={STATIC_MAX_AGE}, immutable')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
             return
-        return super().do_GET()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', f'public, max-age={STATIC_MAX_AGE}, immutable')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.write_body(body)
 
     def serve_template(self, template_name):
         """Serve an HTML template without any templating engine."""
-        template_path = os.path.join(TEMPLATES_DIR, template_name)
-        if not os.path.exists(template_path):
+        content = _TEMPLATE_CACHE.get(template_name)
+        if content is None:
             self.send_error(404, 'Template not found')
             return
-        with open(template_path, 'r', encoding='utf-8') as f:
-            content = f.read()
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
         self.end_headers()
-        self.wfile.write(content.encode('utf-8'))
+        self.write_body(content)
 
     def get_session_id(self):
         """Retrieve session_id from request cookies, if present."""
@@ -131,7 +206,15 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
     def is_authenticated(self):
         """Check if an admin session is authenticated."""
         session_id = self.get_session_id()
-        return bool(session_id and sessions.get(session_id))
+        return bool(session_id and verify_session(session_id))
+
+    def get_page(self):
+        """Return the 1-based ``page`` query parameter, defaulting to 1."""
+        params = parse_qs(urlparse(self.path).query)
+        try:
+            return max(int(params.get('page', ['1'])[0]), 1)
+        except ValueError:
+            return 1
 
     def serve_admin(self):
         """Render and serve the admin dashboard. Redirect to login if not authenticated."""
@@ -140,40 +223,14 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
             self.send_header('Location', '/admin/login')
             self.end_headers()
             return
-        # Pull attendance records from DB (descending by timestamp)
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            'SELECT id, employee_id, action, timestamp, latitude, longitude '
-            'FROM attendance ORDER BY timestamp DESC'
-        )
-        records = cur.fetchall()
-        conn.close()
-        # Build table rows
-        rows = []
-        for rec_id, employee_id, action, ts, lat, lon in records:
-            lat_display = lat if lat is not None else '-'
-            lon_display = lon if lon is not None else '-'
-            rows.append(
-                f'<tr>'
-                f'<td>{rec_id}</td>'
-                f'<td>{employee_id}</td>'
-                f'<td>{action}</td>'
-                f'<td>{ts}</td>'
-                f'<td>{lat_display}</td>'
-                f'<td>{lon_display}</td>'
-                f'</tr>'
-            )
-        rows_html = ''.join(rows)
-        # Load admin template and inject rows into placeholder
-        template_path = os.path.join(TEMPLATES_DIR, 'admin.html')
-        with open(template_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        content = content.replace('<!-- Records will be injected by the server -->', rows_html)
+        rows_html = admin_rows_html(self.get_page())
+        # Inject rows between the cached halves of the admin template
+        body = _ADMIN_HEAD + rows_html.encode('utf-8') + _ADMIN_TAIL
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(content.encode('utf-8'))
+        self.write_body(body)
 
     def handle_punch(self):
         """API endpoint to record a punch action (in/out) with geolocation."""
@@ -182,52 +239,56 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
         try:
             data = json.loads(body.decode('utf-8'))
         except Exception:
-            self.send_response(400)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'message': 'Invalid JSON.'}).encode('utf-8'))
-            return
+            data = None
+        if not isinstance(data, dict):
+            return self.send_json(400, {'success': False, 'message': 'Invalid JSON.'})
         employee_id = data.get('employee_id')
         action = data.get('action')
         latitude = data.get('latitude')
         longitude = data.get('longitude')
         if not employee_id or action not in ('in', 'out'):
-            self.send_response(400)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'message': 'Invalid payload.'}).encode('utf-8'))
-            return
-        timestamp = datetime.utcnow().isoformat()
+            return self.send_json(400, {'success': False, 'message': 'Invalid payload.'})
         # Insert record into database
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO attendance (employee_id, action, timestamp, latitude, longitude) VALUES (?, ?, ?, ?, ?)',
-            (employee_id, action, timestamp, latitude, longitude)
-        )
-        conn.commit()
-        conn.close()
+        try:
+            record_punch(employee_id, action, latitude, longitude)
+        except ValueError as exc:
+            return self.send_json(400, {'success': False, 'message': str(exc)})
+        except TimeoutError:
+            return self.send_json(503, {'success': False, 'message': 'Server is busy, please try again.'})
         # Respond success
-        self.send_response(200)
+        self.send_json(200, {'success': True, 'message': 'Punch recorded successfully.'})
+
+    def send_json(self, status, payload):
+        """Send ``payload`` as a JSON response with the given status code."""
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
-        self.wfile.write(json.dumps({'success': True, 'message': 'Punch recorded successfully.'}).encode('utf-8'))
+        self.wfile.write(json.dumps(payload).encode('utf-8'))
 
     def handle_login(self):
         """Process admin login. Set a session cookie on successful authentication."""
         content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length)
-        params = parse_qs(body.decode('utf-8'))
-        username = params.get('username', [''])[0]
-        password = params.get('password', [''])[0]
+        body = self.rfile.read(content_length).decode('utf-8', 'replace')
+        # Only two fields matter, so pick them out instead of building a parse_qs dict
+        username = password = ''
+        for field in body.split('&'):
+            key, _, value = field.partition('=')
+            if key == 'username':
+                username = unquote_plus(value)
+            elif key == 'password':
+                password = unquote_plus(value)
         admin_username = os.environ.get('ADMIN_USERNAME', 'admin')
         admin_password = os.environ.get('ADMIN_PASSWORD', 'admin123')
-        if username == admin_username and password == admin_password:
-            session_id = str(uuid.uuid4())
-            sessions[session_id] = True
+        # Constant-time comparison; `&` evaluates both so timing does not reveal which failed
+        username_ok = hmac.compare_digest(username.encode('utf-8'), admin_username.encode('utf-8'))
+        password_ok = hmac.compare_digest(password.encode('utf-8'), admin_password.encode('utf-8'))
+        if username_ok & password_ok:
+            cookie = f'session_id={sign_session()}; HttpOnly; SameSite=Lax; Max-Age={SESSION_MAX_AGE}; Path=/'
+            if SESSION_COOKIE_SECURE:
+                cookie += '; Secure'
             self.send_response(302)
             self.send_header('Location', '/admin')
-            self.send_header('Set-Cookie', f'session_id={session_id}; HttpOnly; Path=/')
+            self.send_header('Set-Cookie', cookie)
             self.end_headers()
         else:
             # Redirect back to login page with error query parameter
@@ -236,10 +297,7 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
             self.end_headers()
 
     def handle_logout(self):
-        """Log out the admin by clearing session cookie and memory."""
-        session_id = self.get_session_id()
-        if session_id and session_id in sessions:
-            del sessions[session_id]
+        """Log out the admin by clearing the session cookie."""
         self.send_response(302)
         # Expire the cookie
         self.send_header('Set-Cookie', 'session_id=deleted; expires=Thu, 01 Jan 1970 00:00:00 GMT; Path=/')
@@ -253,30 +311,28 @@ class AttendanceHandler(SimpleHTTPRequestHandler):
             self.send_header('Location', '/admin/login')
             self.end_headers()
             return
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute('SELECT employee_id, action, timestamp, latitude, longitude FROM attendance ORDER BY timestamp')
-        rows = cur.fetchall()
-        conn.close()
-        # Build CSV text
-        csv_lines = ['Employee ID,Action,Timestamp (UTC),Latitude,Longitude']
-        for emp_id, action, ts, lat, lon in rows:
-            lat_val = '' if lat is None else lat
-            lon_val = '' if lon is None else lon
-            csv_lines.append(f'{emp_id},{action},{ts},{lat_val},{lon_val}')
-        csv_data = '\n'.join(csv_lines)
         filename = f'attendance_{datetime.utcnow().strftime("%Y%m%d%H%M%S")}.csv'
+        chunks = iter_export_csv()
+        # No Content-Length: the body is streamed and ends when the connection closes
         self.send_response(200)
         self.send_header('Content-Type', 'text/csv')
         self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Vary', 'Accept-Encoding')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            chunks = gzip_stream(chunks)
+            self.send_header('Content-Encoding', 'gzip')
         self.end_headers()
-        self.wfile.write(csv_data.encode('utf-8'))
+        if self.command == 'HEAD':
+            # The export query only runs once the generator is iterated
+            return
+        for chunk in chunks:
+            self.wfile.write(chunk)
 
 
 def run():
     init_db()
     port = int(os.environ.get('PORT', 8000))
-    httpd = HTTPServer(('0.0.0.0', port), AttendanceHandler)
+    httpd = ThreadingHTTPServer(('0.0.0.0', port), AttendanceHandler)
     print(f"Serving attendance app on http://localhost:{port}")
     try:
         httpd.serve_forever()